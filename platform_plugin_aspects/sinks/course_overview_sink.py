@@ -12,6 +12,8 @@ LTI passwords and other secrets. We just take the fields necessary for reporting
 
 import datetime
 import json
+import warnings
+from collections import deque
 
 from opaque_keys.edx.keys import CourseKey
 
@@ -20,7 +22,7 @@ from platform_plugin_aspects.sinks.serializers import CourseOverviewSerializer
 from platform_plugin_aspects.utils import (
     get_detached_xblock_types,
     get_modulestore,
-    get_tags_for_block,
+    get_tags_for_blocks,
 )
 
 # Defaults we want to ensure we fail early on bulk inserts
@@ -31,6 +33,23 @@ CLICKHOUSE_BULK_INSERT_PARAMS = {
 
 MODULESTORE_PUBLISHED_ONLY_FLAG = "rev-opt-published-only"
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    # orjson is optional, it's only used to speed up serializing large courses.
+    # The fallback path of _json_dumps is tested by patching orjson out.
+    orjson = None
+
+
+def _json_dumps(obj):
+    """
+    Serialize obj to a JSON string, the same way whether or not orjson is installed.
+    """
+    if orjson is None:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+    return orjson.dumps(obj).decode("utf-8")
+
 
 class XBlockSink(ModelBaseSink):
     """
@@ -44,43 +63,68 @@ class XBlockSink(ModelBaseSink):
     nested_sinks = []
 
     def dump_related(self, serialized_item, dump_id, time_last_dumped):
-        """Dump all XBlocks for a course"""
+        """
+        Dump all XBlocks for a course.
+
+        All blocks are sent to ClickHouse in a single CSV insert, see send_item.
+        """
         self.dump(
             serialized_item,
             many=True,
             initial={"dump_id": dump_id, "time_last_dumped": time_last_dumped},
         )
 
-    def get_xblocks_recursive(self, parent_block, detached_xblock_types, initial):
+    def get_xblocks_in_tree_order(self, parent_block, detached_xblock_types, initial):
         """
-        Serialize the course tree recursively, return a flattened list of XBlocks.
+        Serialize the course tree, return a flattened list of XBlocks.
 
         Note that this list will not include detached blocks, those are handled
         in get_detached_xblocks. This method preserves the course ordering for
         non-detached blocks.
-        """
-        items = [
-            self.serialize_xblock(
-                parent_block,
-                detached_xblock_types,
-                initial["dump_id"],
-                initial["time_last_dumped"],
-            )
-        ]
 
-        for child in parent_block.get_children():
-            items.extend(
-                self.get_xblocks_recursive(child, detached_xblock_types, initial)
+        The tree is walked depth-first with an explicit stack rather than by
+        recursion, so very deep courses can't hit the interpreter's recursion
+        limit.
+        """
+        serialize_xblock = self.serialize_xblock
+        dump_id = initial["dump_id"]
+        time_last_dumped = initial["time_last_dumped"]
+
+        items = []
+        stack = deque([parent_block])
+
+        while stack:
+            block = stack.popleft()
+            items.append(
+                serialize_xblock(
+                    block, detached_xblock_types, dump_id, time_last_dumped
+                )
             )
+            # extendleft reverses its input, so reverse the children first to
+            # keep them in course order at the front of the stack.
+            stack.extendleft(reversed(block.get_children()))
 
         return items
 
-    def get_detached_xblocks(self, course_blocks, detached_xblock_types, initial):
+    def get_xblocks_recursive(self, parent_block, detached_xblock_types, initial):
         """
-        Spin through the flat list of all blocks in a course and return only
-        the detached blocks. Ordering of non-detached blocks is already
-        guaranteed in get_xblocks_recursive. Order of detached blocks
-        is not guaranteed.
+        Deprecated alias of get_xblocks_in_tree_order, kept for existing callers.
+        """
+        warnings.warn(
+            "XBlockSink.get_xblocks_recursive is deprecated, "
+            "use get_xblocks_in_tree_order instead.",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        return self.get_xblocks_in_tree_order(
+            parent_block, detached_xblock_types, initial
+        )
+
+    def get_detached_xblocks(self, detached_blocks, detached_xblock_types, initial):
+        """
+        Serialize the detached blocks of a course. Ordering of non-detached
+        blocks is already guaranteed in get_xblocks_in_tree_order. Order of
+        detached blocks is not guaranteed.
         """
         return [
             self.serialize_xblock(
@@ -89,8 +133,7 @@ class XBlockSink(ModelBaseSink):
                 initial["dump_id"],
                 initial["time_last_dumped"],
             )
-            for block in course_blocks
-            if block.scope_ids.block_type in detached_xblock_types
+            for block in detached_blocks
         ]
 
     def serialize_item(self, item, many=False, initial=None):
@@ -99,9 +142,8 @@ class XBlockSink(ModelBaseSink):
         """
         course_key = CourseKey.from_string(item["course_key"])
         modulestore = get_modulestore()
-        detached_xblock_types = get_detached_xblock_types()
-
-        location_to_node = {}
+        # Membership is checked once per block, make sure it's a hashed lookup
+        detached_xblock_types = frozenset(get_detached_xblock_types())
 
         # This call gets the entire course tree in order, because the
         # get_items call does not guarantee ordering. It does not return
@@ -110,56 +152,81 @@ class XBlockSink(ModelBaseSink):
             course_key, revision=MODULESTORE_PUBLISHED_ONLY_FLAG
         )
 
-        items = self.get_xblocks_recursive(course_block, detached_xblock_types, initial)
+        items = self.get_xblocks_in_tree_order(
+            course_block, detached_xblock_types, initial
+        )
 
-        # Here we fetch the detached blocks and add them to the list.
+        # Here we fetch the detached blocks and add them to the list. Only the
+        # detached categories are requested, the rest are already in the tree.
         detached = self.get_detached_xblocks(
-            modulestore.get_items(course_key, revision=MODULESTORE_PUBLISHED_ONLY_FLAG),
+            modulestore.get_items(
+                course_key,
+                revision=MODULESTORE_PUBLISHED_ONLY_FLAG,
+                qualifiers={"category": {"$in": list(detached_xblock_types)}},
+            ),
             detached_xblock_types,
             initial,
         )
 
         items.extend(detached)
 
+        # Fetch the tags for every block in the course at once
+        tags_by_location = get_tags_for_blocks(
+            course_key, [block["location"] for block in items]
+        )
+
         # Add location and tag data to the dict mappings of the blocks
         index = 0
         section_idx = 0
         subsection_idx = 0
         unit_idx = 0
 
+        # A block should only be sent once, even if it is returned by both the
+        # course tree and the detached blocks query. The first (tree) occurrence
+        # wins so that it keeps its place in the course ordering.
+        seen_locations = set()
+        serialized_blocks = []
+
         for block in items:
+            location = block["location"]
+            if location in seen_locations:
+                continue
+            seen_locations.add(location)
+
             index += 1
 
             block["order"] = index
 
+            json_data = block["xblock_data_json"]
+
             # Ensure that detached types aren't part of the tree
-            if block["xblock_data_json"]["detached"]:
-                block["xblock_data_json"]["section"] = 0
-                block["xblock_data_json"]["subsection"] = 0
-                block["xblock_data_json"]["unit"] = 0
+            if json_data["detached"]:
+                json_data["section"] = 0
+                json_data["subsection"] = 0
+                json_data["unit"] = 0
             else:
-                if block["xblock_data_json"]["block_type"] == "chapter":
+                block_type = json_data["block_type"]
+
+                if block_type == "chapter":
                     section_idx += 1
                     subsection_idx = 0
                     unit_idx = 0
-                elif block["xblock_data_json"]["block_type"] == "sequential":
+                elif block_type == "sequential":
                     subsection_idx += 1
                     unit_idx = 0
-                elif block["xblock_data_json"]["block_type"] == "vertical":
+                elif block_type == "vertical":
                     unit_idx += 1
 
-                block["xblock_data_json"]["section"] = section_idx
-                block["xblock_data_json"]["subsection"] = subsection_idx
-                block["xblock_data_json"]["unit"] = unit_idx
+                json_data["section"] = section_idx
+                json_data["subsection"] = subsection_idx
+                json_data["unit"] = unit_idx
 
-            block["xblock_data_json"]["tags"] = get_tags_for_block(
-                block["location"],
-            )
+            json_data["tags"] = tags_by_location.get(location, {})
 
-            block["xblock_data_json"] = json.dumps(block["xblock_data_json"])
-            location_to_node[block["location"]] = block
+            block["xblock_data_json"] = _json_dumps(json_data)
+            serialized_blocks.append(block)
 
-        return list(location_to_node.values())
+        return serialized_blocks
 
     def serialize_xblock(self, item, detached_xblock_types, dump_id, time_last_dumped):
         """Serialize an XBlock instance into a dict"""
@@ -172,7 +239,7 @@ class XBlockSink(ModelBaseSink):
             "course": course_key.course,
             "run": course_key.run,
             "block_type": block_type,
-            "detached": 1 if block_type in detached_xblock_types else 0,
+            "detached": int(block_type in detached_xblock_types),
             "graded": 1 if getattr(item, "graded", False) else 0,
             "completion_mode": getattr(item, "completion_mode", ""),
         }
@@ -182,7 +249,7 @@ class XBlockSink(ModelBaseSink):
             "org": course_key.org,
             "course_key": str(course_key),
             "location": str(XBlockSink.strip_branch_and_version(item.location)),
-            "display_name": item.display_name_with_default.replace("'", "'"),
+            "display_name": item.display_name_with_default,
             "xblock_data_json": json_data,
             # We need to add this here so the key will be in the right place
             # in the generated csv
@@ -245,11 +312,9 @@ class CourseOverviewSink(ModelBaseSink):  # pylint: disable=abstract-method
             return False, "No last modified date in CourseOverview"
 
         # Otherwise, dump it if it is newer
-        course_last_dump_time = datetime.datetime.strptime(
-            course_last_dump_time, "%Y-%m-%d %H:%M:%S.%f+00:00"
-        )
-        course_last_published_date = datetime.datetime.strptime(
-            course_last_published_date, "%Y-%m-%d %H:%M:%S.%f+00:00"
+        course_last_dump_time = datetime.datetime.fromisoformat(course_last_dump_time)
+        course_last_published_date = datetime.datetime.fromisoformat(
+            course_last_published_date
         )
         needs_dump = course_last_dump_time < course_last_published_date
 
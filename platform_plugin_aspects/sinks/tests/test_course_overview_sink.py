@@ -4,6 +4,7 @@ Tests for the course_overview_sink sinks.
 
 import json
 import logging
+import sys
 from datetime import datetime
 from unittest.mock import MagicMock, patch
 
@@ -14,9 +15,14 @@ from django.test.utils import override_settings
 from responses import matchers
 from responses.registries import OrderedRegistry
 
-from platform_plugin_aspects.sinks import CourseOverviewSink, XBlockSink
+from platform_plugin_aspects.sinks import (
+    CourseOverviewSink,
+    XBlockSink,
+    course_overview_sink,
+)
 from platform_plugin_aspects.tasks import dump_course_to_clickhouse
 from test_utils.helpers import (
+    FakeXBlock,
     check_block_csv_matcher,
     check_overview_csv_matcher,
     course_factory,
@@ -34,7 +40,7 @@ from test_utils.helpers import (
     registry=OrderedRegistry
 )
 @override_settings(EVENT_SINK_CLICKHOUSE_COURSE_OVERVIEW_ENABLED=True)
-@patch("platform_plugin_aspects.sinks.course_overview_sink.get_tags_for_block")
+@patch("platform_plugin_aspects.sinks.course_overview_sink.get_tags_for_blocks")
 @patch("platform_plugin_aspects.sinks.CourseOverviewSink.serialize_item")
 @patch("platform_plugin_aspects.sinks.CourseOverviewSink.get_model")
 @patch("platform_plugin_aspects.sinks.course_overview_sink.get_detached_xblock_types")
@@ -68,7 +74,7 @@ def test_course_publish_success(
     mock_overview.return_value.get_from_id.return_value = course_overview
     mock_get_ccx_courses.return_value = []
 
-    # Fake the "get_tags_for_block" api since we can't import it here
+    # Fake the "get_tags_for_blocks" api since we can't import it here
     mock_get_tags.return_value = {}
 
     # Use the responses library to catch the POSTs to ClickHouse
@@ -100,11 +106,11 @@ def test_course_publish_success(
     assert mock_modulestore.call_count == 1
     assert mock_modulestore.return_value.get_course.call_count == 1
     assert mock_modulestore.return_value.get_items.call_count == 1
+    qualifiers = mock_modulestore.return_value.get_items.call_args.kwargs["qualifiers"]
+    assert set(qualifiers["category"]["$in"]) == mock_detached_xblock_types()
     assert mock_detached.call_count == 1
     mock_get_ccx_courses.assert_called_once_with(course_overview.id)
-    assert mock_get_tags.call_count == len(
-        get_all_course_blocks_list(course, detached_blocks)
-    )
+    assert mock_get_tags.call_count == 1
 
 
 @responses.activate(  # pylint: disable=unexpected-keyword-arg,no-value-for-parameter
@@ -211,6 +217,47 @@ def test_should_dump_item():
     assert "Course has been published since last dump time - " in reason
 
 
+@responses.activate(  # pylint: disable=unexpected-keyword-arg,no-value-for-parameter
+    registry=OrderedRegistry
+)
+def test_should_dump_item_no_microseconds():
+    """
+    Test that timestamps without microseconds, as str() renders them, still compare.
+    """
+    course_overview = fake_course_overview_factory(modified="2023-05-03 15:47:40+00:00")
+    responses.get("https://foo.bar/", body="2023-05-03 15:47:39.331024+00:00")
+
+    sink = CourseOverviewSink(connection_overrides={}, log=logging.getLogger())
+    should_dump_course, reason = sink.should_dump_item(course_overview)
+
+    assert should_dump_course is True
+    assert "Course has been published since last dump time - " in reason
+
+
+@responses.activate(  # pylint: disable=unexpected-keyword-arg,no-value-for-parameter
+    registry=OrderedRegistry
+)
+def test_should_dump_item_mixed_offsets():
+    """
+    Test that timestamps are compared as datetimes, not as strings.
+
+    Both values are str() of a datetime, built on separate code paths, so their
+    UTC offset and layout follow whatever datetime was parsed or stored. The two
+    values here are equal once the offset is applied. Compared as strings, the
+    last dump time would look newer than the publish date.
+    """
+    course_overview = fake_course_overview_factory(
+        modified="2023-05-03 16:00:00.000000+00:00"
+    )
+    responses.get("https://foo.bar/", body="2023-05-03 17:00:00.000000+02:00")
+
+    sink = CourseOverviewSink(connection_overrides={}, log=logging.getLogger())
+    should_dump_course, reason = sink.should_dump_item(course_overview)
+
+    assert should_dump_course is True
+    assert "Course has been published since last dump time - " in reason
+
+
 @responses.activate(  # pylint: disable=unexpected-keyword-arg,no-value-for-parameter
     registry=OrderedRegistry
 )
@@ -287,7 +334,7 @@ def test_get_last_dump_time():
     assert dt
 
 
-@patch("platform_plugin_aspects.sinks.course_overview_sink.get_tags_for_block")
+@patch("platform_plugin_aspects.sinks.course_overview_sink.get_tags_for_blocks")
 @patch("platform_plugin_aspects.sinks.course_overview_sink.get_detached_xblock_types")
 @patch("platform_plugin_aspects.sinks.course_overview_sink.get_modulestore")
 # pytest:disable=unused-argument
@@ -307,7 +354,7 @@ def test_xblock_tree_structure(mock_modulestore, mock_detached, mock_get_tags):
         course_overview
     )
 
-    # Fake the "get_tags_for_course" api since we can't import it here
+    # Fake the "get_tags_for_blocks" api since we can't import it here
     mock_get_tags.return_value = {}
 
     sink = XBlockSink(connection_overrides={}, log=MagicMock())
@@ -352,7 +399,7 @@ def test_xblock_tree_structure(mock_modulestore, mock_detached, mock_get_tags):
     _check_tree_location(results[27], 3, 3, 3)
 
 
-@patch("platform_plugin_aspects.sinks.course_overview_sink.get_tags_for_block")
+@patch("platform_plugin_aspects.sinks.course_overview_sink.get_tags_for_blocks")
 @patch("platform_plugin_aspects.sinks.course_overview_sink.get_detached_xblock_types")
 @patch("platform_plugin_aspects.sinks.course_overview_sink.get_modulestore")
 def test_xblock_graded_completable_mode(mock_modulestore, mock_detached, mock_get_tags):
@@ -368,7 +415,9 @@ def test_xblock_graded_completable_mode(mock_modulestore, mock_detached, mock_ge
     mock_detached.return_value = mock_detached_xblock_types()
 
     expected_tags = ["TAX1=tag1", "TAX1=tag2", "TAX1=tag3"]
-    mock_get_tags.return_value = expected_tags
+    mock_get_tags.side_effect = lambda course_key, locations: {
+        location: expected_tags for location in locations
+    }
 
     fake_serialized_course_overview = fake_serialize_fake_course_overview(
         course_overview
@@ -405,3 +454,84 @@ def test_xblock_graded_completable_mode(mock_modulestore, mock_detached, mock_ge
     _check_item_serialized_location(results[31], 0, "completable")
     _check_item_serialized_location(results[32], 0, "aggregator")
     _check_item_serialized_location(results[33], 0, "excluded")
+
+
+def test_get_xblocks_in_tree_order_deep_tree():
+    """
+    Test that a course tree deeper than the recursion limit serializes in order.
+    """
+    course = FakeXBlock("top", block_type="course")
+    expected = [course]
+    parent = course
+
+    for i in range(sys.getrecursionlimit() + 10):
+        child = FakeXBlock(f"Child {i}")
+        parent.children.append(child)
+        expected.append(child)
+        parent = child
+
+    sink = XBlockSink(connection_overrides={}, log=MagicMock())
+    initial_data = {"dump_id": "xyz", "time_last_dumped": "2023-09-05"}
+    results = sink.get_xblocks_in_tree_order(course, set(), initial_data)
+
+    assert [r["location"] for r in results] == [str(b.location) for b in expected]
+
+
+def test_get_xblocks_recursive_deprecated():
+    """
+    Test that the old get_xblocks_recursive name still works, with a warning.
+    """
+    course = course_factory()
+    sink = XBlockSink(connection_overrides={}, log=MagicMock())
+    initial_data = {"dump_id": "xyz", "time_last_dumped": "2023-09-05"}
+
+    with pytest.warns(DeprecationWarning):
+        results = sink.get_xblocks_recursive(course, set(), initial_data)
+
+    expected = get_all_course_blocks_list(course, [])
+    assert [r["location"] for r in results] == [str(b.location) for b in expected]
+
+
+@patch("platform_plugin_aspects.sinks.course_overview_sink.get_tags_for_blocks")
+@patch("platform_plugin_aspects.sinks.course_overview_sink.get_detached_xblock_types")
+@patch("platform_plugin_aspects.sinks.course_overview_sink.get_modulestore")
+def test_xblock_duplicate_locations(mock_modulestore, mock_detached, mock_get_tags):
+    """
+    Test that a block returned by both the tree and the detached query is only sent once.
+    """
+    course = course_factory()
+    detached_blocks = detached_xblock_factory()
+    course.children.append(detached_blocks[0])
+    course_overview = fake_course_overview_factory(modified=datetime.now())
+    mock_modulestore.return_value.get_course.return_value = course
+    mock_modulestore.return_value.get_items.return_value = detached_blocks
+    mock_detached.return_value = mock_detached_xblock_types()
+    mock_get_tags.return_value = {}
+
+    sink = XBlockSink(connection_overrides={}, log=MagicMock())
+    initial_data = {"dump_id": "xyz", "time_last_dumped": "2023-09-05"}
+    results = sink.serialize_item(
+        fake_serialize_fake_course_overview(course_overview), initial=initial_data
+    )
+
+    expected = get_all_course_blocks_list(course, detached_blocks[1:])
+    assert [r["location"] for r in results] == [str(b.location) for b in expected]
+    assert [r["order"] for r in results] == list(range(1, len(expected) + 1))
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_json_dumps(use_orjson):
+    """
+    Test that xblock_data_json is encoded identically with and without orjson.
+    """
+    data = {"display_name": "Módulo 1", "detached": 0, "tags": {"Tax": ["a", "b"]}}
+    orjson = course_overview_sink.orjson if use_orjson else None
+
+    with patch.object(course_overview_sink, "orjson", orjson):
+        encoded = course_overview_sink._json_dumps(  # pylint: disable=protected-access
+            data
+        )
+
+    assert (
+        encoded == '{"display_name":"Módulo 1","detached":0,"tags":{"Tax":["a","b"]}}'
+    )
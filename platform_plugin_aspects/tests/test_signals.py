@@ -4,7 +4,7 @@ Tests for signal handlers.
 
 from unittest.mock import Mock, patch
 
-from django.test import TestCase
+from django.test import SimpleTestCase
 
 from platform_plugin_aspects.signals import (
     on_externalid_saved,
@@ -15,7 +15,7 @@ from platform_plugin_aspects.sinks.external_id_sink import ExternalIdSink
 from platform_plugin_aspects.sinks.user_retire_sink import UserRetirementSink
 
 
-class SignalHandlersTestCase(TestCase):
+class SignalHandlersTestCase(SimpleTestCase):
     """
     Test cases for signal handlers.
     """
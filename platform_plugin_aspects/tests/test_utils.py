@@ -2,6 +2,7 @@
 Test utils.
 """
 
+from types import SimpleNamespace
 from unittest.mock import Mock, patch
 
 from django.conf import settings
@@ -15,6 +16,7 @@ from platform_plugin_aspects.utils import (
     get_ccx_courses,
     get_model,
     get_tags_for_block,
+    get_tags_for_blocks,
 )
 from test_utils.helpers import course_factory
 
@@ -268,3 +270,77 @@ class TestUtils(TestCase):
             "Taxonomy Two": ["tag2.1", "tag2.2"],
         }
         mock_get_object_tags.assert_called_once_with(course.location)
+
+    @patch("platform_plugin_aspects.utils._get_all_object_tags")
+    def test_get_tags_for_blocks(self, mock_get_all_object_tags):
+        """
+        Tests that get_tags_for_blocks works when mocking the openedx dependency.
+
+        Tags from disabled taxonomies are left out, each taxonomy's tags are in
+        tree order, and each tag's parents are only walked once.
+        """
+        course = course_factory()
+        block = course.children[0]
+        untagged_block = course.children[1]
+        taxonomy = SimpleNamespace(name="Taxonomy One", enabled=True)
+        disabled_taxonomy = SimpleNamespace(name="Disabled", enabled=False)
+
+        class FakeTag:
+            """
+            A Tag that counts how many times its parent is loaded.
+            """
+
+            def __init__(self, tag_id, value, parent=None, tag_taxonomy=taxonomy):
+                self.id = tag_id
+                self.value = value
+                self.taxonomy = tag_taxonomy
+                self._parent = parent
+                self.parent_loads = 0
+
+            @property
+            def parent(self):
+                self.parent_loads += 1
+                return self._parent
+
+        tag_a = FakeTag(1, "A")
+        tag_a1 = FakeTag(2, "A.1", tag_a)
+        tag_b = FakeTag(3, "B")
+        tag_disabled = FakeTag(4, "Hidden", tag_taxonomy=disabled_taxonomy)
+        mock_get_all_object_tags.return_value = {
+            str(course.location): {
+                1: [SimpleNamespace(tag=tag_b), SimpleNamespace(tag=tag_a1)],
+                2: [SimpleNamespace(tag=tag_disabled)],
+            },
+            str(block.location): {1: [SimpleNamespace(tag=tag_a1)]},
+        }
+
+        locations = [
+            str(course.location),
+            str(block.location),
+            str(untagged_block.location),
+        ]
+        tags = get_tags_for_blocks(course.location.course_key, locations)
+        assert tags == {
+            str(course.location): {"Taxonomy One": ["A.1", "A", "B"]},
+            str(block.location): {"Taxonomy One": ["A.1", "A"]},
+            str(untagged_block.location): {},
+        }
+        assert tag_a1.parent_loads == 1
+        mock_get_all_object_tags.assert_called_once_with(course.location.course_key)
+
+    @patch("platform_plugin_aspects.utils._get_object_tags")
+    @patch("platform_plugin_aspects.utils._get_all_object_tags")
+    def test_get_tags_for_blocks_fallback(
+        self, mock_get_all_object_tags, mock_get_object_tags
+    ):
+        """
+        Tests that get_tags_for_blocks falls back to per-block lookups without the bulk API.
+        """
+        course = course_factory()
+        mock_get_all_object_tags.return_value = None
+        mock_get_object_tags.return_value = []
+
+        locations = [str(course.location), str(course.children[0].location)]
+        tags = get_tags_for_blocks(course.location.course_key, locations)
+        assert tags == {location: {} for location in locations}
+        assert mock_get_object_tags.call_count == 2
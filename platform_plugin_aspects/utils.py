@@ -294,13 +294,97 @@ def _get_object_tags(usage_key):  # pragma: no cover
         return {}
 
 
+def _get_all_object_tags(course_key):  # pragma: no cover
+    """
+    Wrap the Open edX tagging API method get_all_object_tags.
+
+    Returns None if the API is not available, so callers can fall back to
+    fetching tags one block at a time.
+    """
+    try:
+        # pylint: disable=import-outside-toplevel
+        from openedx.core.djangoapps.content_tagging.api import get_all_object_tags
+
+        all_object_tags, _ = get_all_object_tags(course_key)
+        return all_object_tags
+    except ImportError:
+        return None
+
+
 def get_tags_for_block(usage_key) -> dict:
     """
     Return all the tags (and their parent tags) applied to the given block.
 
     Returns a dict of [taxonomy]: [tag, tag, tag]
     """
-    tags = _get_object_tags(usage_key)
+    return _serialize_tags(_get_object_tags(usage_key))
+
+
+def get_tags_for_blocks(course_key, usage_keys) -> dict:
+    """
+    Return all the tags (and their parent tags) applied to the given blocks of a course.
+
+    The tags for the whole course are fetched in a single call to the tagging API
+    instead of one call per block. Like get_object_tags, tags from disabled
+    taxonomies are left out and each taxonomy's tags are listed in tree order.
+
+    Returns a dict of [usage_key]: {[taxonomy]: [tag, tag, tag]}
+    """
+    all_object_tags = _get_all_object_tags(course_key)
+
+    if all_object_tags is None:
+        return {usage_key: get_tags_for_block(usage_key) for usage_key in usage_keys}
+
+    # Blocks in a course tend to share tags, and get_all_object_tags doesn't
+    # select tag parents, so only walk each tag's parents once.
+    lineages = {}
+    tags_by_block = {}
+
+    for usage_key in usage_keys:
+        serialized_tags = {}
+
+        for object_tags in all_object_tags.get(str(usage_key), {}).values():
+            block_lineages = []
+
+            for object_tag in object_tags:
+                tag = object_tag.tag
+                if not tag.taxonomy.enabled:
+                    continue
+
+                if tag.id not in lineages:
+                    lineages[tag.id] = _get_tag_lineage(tag)
+                block_lineages.append((tag.taxonomy.name, lineages[tag.id]))
+
+            # Lineages are leaf first, tree order compares them from the root
+            for taxonomy_name, lineage in sorted(
+                block_lineages, key=lambda item: item[1][::-1]
+            ):
+                serialized_tags.setdefault(taxonomy_name, []).extend(lineage)
+
+        tags_by_block[usage_key] = serialized_tags
+
+    return tags_by_block
+
+
+def _get_tag_lineage(tag) -> list:
+    """
+    Return the values of the given tag and its parent tags, starting with the tag itself.
+    """
+    lineage = []
+
+    while tag:
+        lineage.append(tag.value)
+        tag = tag.parent
+
+    return lineage
+
+
+def _serialize_tags(tags) -> dict:
+    """
+    Serialize the given object tags, including their parent tags.
+
+    Returns a dict of [taxonomy]: [tag, tag, tag]
+    """
     serialized_tags = {}
 
     for explicit_tag in tags: